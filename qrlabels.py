@@ -7,9 +7,19 @@
 import streamlit as st
 import qrcode
 import os
+import argparse
+import bisect
+import functools
+import glob
 import io
+import sys
+import threading
 import urllib.error
 import urllib.request
+import weakref
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from PIL import Image, ImageDraw, ImageFont
 
 ################################
@@ -86,102 +96,160 @@ def priority_fonts(text, size):
     # Last resort
     print("> Using default font as fallback")
     return ImageFont.load_default()
-########################################
-# Generate label with text and QR code #
-########################################
-
-def generate_label(label_text, qr_text, width=600, height=200, margin=5, font_size=50, 
-                   qr_size=185, draw_border=True, border_width=4, border_margin=5, 
-                   correction_level='H', qr_color=(0,0,0,255), text_color=(0,0,0,255), 
-                   label_color=(255,255,255,255), border_color=(0,0,0,255)):
-    '''
-    Generate a label with text and QR code
-    '''
-    
-    # Create label rectangle with the specified background color
-    label = Image.new('RGBA', (width, height), color=label_color)
-    draw = ImageDraw.Draw(label)
-
-    # Draw border if enabled
-    if draw_border:
-        draw.rectangle(
-            [(border_margin, border_margin), (width - border_margin - 1, height - border_margin - 1)],
-            outline=border_color,
-            width=border_width
-        )
 
-    # Generate QR code
-    # Map correction levels to qrcode constants
-    error_map = {
-        'L': qrcode.constants.ERROR_CORRECT_L,
-        'M': qrcode.constants.ERROR_CORRECT_M,
-        'Q': qrcode.constants.ERROR_CORRECT_Q,
-        'H': qrcode.constants.ERROR_CORRECT_H
-    }
-    if correction_level not in error_map:
-        correction_level = 'H'  # Default to high if invalid
+@functools.lru_cache(maxsize=64)
+def get_font(size):
+    """Load the preferred font once per size."""
+    return priority_fonts('', size)
+
+##################################
+# Cached text measurement/layout #
+##################################
+
+TEXT_BBOX_CACHE_SIZE = 100000   # (font face, size, text) -> bounding box / advance
+TEXT_LAYOUT_CACHE_SIZE = 20000  # (label text, text area) -> wrapped lines
+QR_CACHE_SIZE = 256             # (payload, QR settings) -> resized QR image
+
+class LRUCache:
+    """Small thread-safe LRU mapping."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._data.get(key, default)
+            if key in self._data:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
 
-    qr = qrcode.QRCode(
-        version=None,
-        error_correction=error_map.get(correction_level, qrcode.constants.ERROR_CORRECT_H),
-        box_size=10,
-        border=4
-    )
-
-    # Encode as UTF-8
-    try: 
-        qr_bytes = qr_text.encode('utf-8')
-        qr.add_data(qr_bytes, optimize=0)
-    except Exception:
-        qr.add_data(qr_text)
+@st.cache_resource
+def text_caches():
+    """Text measurement and layout caches shared by all sessions."""
+    return {'bbox': LRUCache(TEXT_BBOX_CACHE_SIZE), 'advance': LRUCache(TEXT_BBOX_CACHE_SIZE),
+            'layout': LRUCache(TEXT_LAYOUT_CACHE_SIZE)}
 
-    # Create the QR code
-    qr.make(fit=True)
-    qr_img = qr.make_image(fill_color=qr_color[:3], back_color="white")  # Use RGB only for QR
-    qr_img = qr_img.resize((qr_size, qr_size))
+@st.cache_resource
+def qr_cache():
+    """Rendered QR images shared by all sessions, keyed by payload and settings."""
+    return LRUCache(QR_CACHE_SIZE)
+
+def font_face(font):
+    """Hashable font face identifier (file path for TrueType fonts)."""
+    path = getattr(font, 'path', None)
+    return path if isinstance(path, str) else id(font)
+
+def text_bbox(draw, text, font, caches=None):
+    """draw.textbbox at the origin, memoized per (font face, size, render mode, text)."""
+    cache = (caches or text_caches())['bbox']
+    key = (font_face(font), getattr(font, 'size', None), draw.fontmode, text)
+    bbox = cache.get(key)
+    if bbox is None:
+        bbox = draw.textbbox((0,0), text, font=font)
+        cache.put(key, bbox)
+    return bbox
+
+def text_advance(draw, text, font, caches=None):
+    """font.getlength in the draw's render mode, memoized like text_bbox."""
+    cache = (caches or text_caches())['advance']
+    key = (font_face(font), getattr(font, 'size', None), draw.fontmode, text)
+    advance = cache.get(key)
+    if advance is None:
+        advance = font.getlength(text, mode=draw.fontmode)
+        cache.put(key, advance)
+    return advance
+
+def fit_text(draw, label_text, font_size, max_width, max_height):
+    '''
+    Wrap label_text and shrink the font until it fits in max_width x max_height.
 
-    # Position QR code on the right
-    qr_x = width - qr_size - margin
-    qr_y = (height - qr_size) // 2
-    label.paste(qr_img, (qr_x, qr_y))
+    Returns (font, font size, lines, line height). Words are measured once per
+    font and size, and the result for each distinct text and text area is
+    cached, so layout cost grows with unique words rather than rows. Line
+    breaks are the same as measuring every line prefix with draw.textbbox.
 
-    # Calculate text position
-    text_area_width = qr_x - margin * 2
-    text_area_height = height - margin * 2
+    A line's width is estimated from its last exact measurement plus word
+    advances; that is off by under a pixel per word added since, so the line
+    is measured exactly whenever the estimate is that close to the limit.
+    '''
+    caches = text_caches()
+    key = (font_face(get_font(font_size)), draw.fontmode, label_text, font_size, max_width, max_height)
+    fit = caches['layout'].get(key)
+    if fit is not None:
+        used_size, current_size, lines, line_height = fit
+        return get_font(used_size), current_size, lines, line_height
 
     # Adjust font size to fit text area if necessary
     current_size = font_size
     lines = []
+    words = label_text.split()
 
     for attempt in range(5):
-        font = priority_fonts(label_text, current_size)
+        used_size = current_size
+        font = get_font(used_size)
 
-        # Split text into lines that fit within text area width
-        words = label_text.split()
+        # Split text into lines that fit within text area width,
+        # adding up cached word advances instead of measuring each line prefix
         lines = []
         current_line = ""
+        line_left = line_right = line_advance = 0  # Current line's bbox and pen position
+        unmeasured = 0  # Words added since the line was last measured exactly
+        try:
+            space_width = text_advance(draw, " ", font, caches)
+        except Exception:
+            space_width = 0
 
         for word in words:
-            test_line = current_line + (" " if current_line else "") + word
-            try: 
-                bbox = draw.textbbox((0,0), test_line, font=font)
-                text_width = bbox[2] - bbox[0]
+            try:
+                bbox = text_bbox(draw, word, font, caches)
+                word_advance = text_advance(draw, word, font, caches)
             except Exception:
-                text_width = text_area_width + 1  # Force overflow
+                bbox, word_advance = (0, 0, max_width + 1, 0), max_width + 1  # Force overflow
 
-            if text_width <= text_area_width:
+            if not current_line:
+                test_line = word
+                test_left, test_right, test_advance = bbox[0], bbox[2], word_advance
+            else:
+                test_line = current_line + " " + word
+                offset = line_advance + space_width
+                test_left = line_left
+                test_right = max(line_right, offset + bbox[2])
+                test_advance = offset + word_advance
+                unmeasured += 1
+                if abs(test_right - test_left - max_width) <= unmeasured:
+                    try:
+                        exact = text_bbox(draw, test_line, font, caches)
+                    except Exception:
+                        exact = (0, 0, max_width + 1, 0)  # Force overflow
+                    test_advance += exact[2] - test_right  # Fold the error into the pen position
+                    test_left, test_right = exact[0], exact[2]
+                    unmeasured = 0
+
+            if test_right - test_left <= max_width:
                 current_line = test_line
+                line_left, line_right, line_advance = test_left, test_right, test_advance
             else:
                 if current_line:
                     lines.append(current_line)
                 current_line = word
+                line_left, line_right, line_advance = bbox[0], bbox[2], word_advance
+                unmeasured = 0
 
         if current_line:
             lines.append(current_line)
 
         # Calculate total text height
         try:
-            bbox = draw.textbbox((0,0), 'Ay', font=font)
+            bbox = text_bbox(draw, 'Ay', font, caches)
             line_height = bbox[3] - bbox[1]
         except Exception:
             line_height = current_size  # Approximate
@@ -193,29 +261,143 @@ def generate_label(label_text, qr_text, width=600, height=200, margin=5, font_si
         text_overflow = False
         for line in lines:
             try:
-                bbox_line = draw.textbbox((0,0), line, font=font)
+                bbox_line = text_bbox(draw, line, font, caches)
                 line_width = bbox_line[2] - bbox_line[0]
-                if line_width > text_area_width:
+                if line_width > max_width:
                     text_overflow = True
                     break
             except Exception:
                 text_overflow = True
                 break
-        
-        if not text_overflow and total_text_height <= text_area_height:
+
+        if not text_overflow and total_text_height <= max_height:
             break  # Text fits, exit loop
-        
+
         current_size = int(current_size * 0.9)  # Reduce font size and try again
         if current_size < 10:
             break  # Prevent font size from getting too small
 
-    # Draw text
-    try:
-        bbox = draw.textbbox((0,0), 'Ay', font=font)
-        line_height = bbox[3] - bbox[1]
+    # If nothing fit, current_size is one step below the font that was used
+    caches['layout'].put(key, (used_size, current_size, lines, line_height))
+    return font, current_size, lines, line_height
+
+##################################
+# Choose the smallest image mode #
+##################################
+
+WHITE = (255, 255, 255, 255)
+
+def pick_image_mode(*colors):
+    """Smallest PIL mode that can hold all RGBA colors: '1', 'L', 'RGB' or 'RGBA'."""
+    if any(c[3] < 255 for c in colors):
+        return 'RGBA'  # Alpha is really used
+    if any(not (c[0] == c[1] == c[2]) for c in colors):
+        return 'RGB'
+    if all(c[0] in (0, 255) for c in colors):
+        return '1'  # Black and white only
+    return 'L'
+
+def mode_color(color, mode):
+    """Convert an RGBA tuple to a fill value for the given mode."""
+    if mode in ('1', 'L'):
+        return color[0]
+    if mode == 'RGB':
+        return tuple(color[:3])
+    return tuple(color)
+
+########################################
+# Generate label with text and QR code #
+########################################
+
+# Map correction levels to qrcode constants
+QR_ERROR_LEVELS = {
+    'L': qrcode.constants.ERROR_CORRECT_L,
+    'M': qrcode.constants.ERROR_CORRECT_M,
+    'Q': qrcode.constants.ERROR_CORRECT_Q,
+    'H': qrcode.constants.ERROR_CORRECT_H
+}
+QR_BORDER = 4  # Quiet zone, in modules
+
+def make_qr_image(qr_text, correction_level, qr_size, qr_fill, mode):
+    """QR code for qr_text, resized to qr_size and converted to mode."""
+    qr = qrcode.QRCode(
+        version=None,
+        error_correction=QR_ERROR_LEVELS[correction_level],
+        box_size=10,
+        border=QR_BORDER
+    )
+
+    # Encode as UTF-8
+    try: 
+        qr_bytes = qr_text.encode('utf-8')
+        qr.add_data(qr_bytes, optimize=0)
     except Exception:
-        line_height = current_size  # Approximate
+        qr.add_data(qr_text)
+
+    # Create the QR code
+    qr.make(fit=True)
+    qr_img = qr.make_image(fill_color=qr_fill, back_color="white")  # Use RGB only for QR
+    # Nearest keeps modules crisp, so converting to '1' does not dither the edges
+    qr_img = qr_img.resize((qr_size, qr_size), Image.NEAREST).convert(mode)
 
+    return qr_img
+
+def generate_label(label_text, qr_text, width=600, height=200, margin=5, font_size=50, 
+                   qr_size=185, draw_border=True, border_width=4, border_margin=5, 
+                   correction_level='H', qr_color=(0,0,0,255), text_color=(0,0,0,255), 
+                   label_color=(255,255,255,255), border_color=(0,0,0,255), mode=None):
+    '''
+    Generate a label with text and QR code
+    '''
+
+    # Use the smallest image mode that fits the colors (QR background is white).
+    # The QR is drawn with its RGB part only, so its alpha does not count.
+    if mode is None:
+        used_colors = [tuple(qr_color[:3]) + (255,), text_color, label_color, WHITE]
+        if draw_border:
+            used_colors.append(border_color)
+        mode = pick_image_mode(*used_colors)
+    qr_fill = mode_color(qr_color, 'RGB')
+    qr_color, text_color, label_color, border_color = (
+        mode_color(c, mode) for c in (qr_color, text_color, label_color, border_color))
+
+    # Create label rectangle with the specified background color
+    label = Image.new(mode, (width, height), color=label_color)
+    draw = ImageDraw.Draw(label)
+
+    # Draw border if enabled
+    if draw_border:
+        draw.rectangle(
+            [(border_margin, border_margin), (width - border_margin - 1, height - border_margin - 1)],
+            outline=border_color,
+            width=border_width
+        )
+
+    # Generate QR code
+    if correction_level not in QR_ERROR_LEVELS:
+        correction_level = 'H'  # Default to high if invalid
+
+    # Reuse the QR image if the same payload was drawn with the same settings
+    qr_key = (qr_text, correction_level, qr_size, qr_fill, mode)
+    qr_img = qr_cache().get(qr_key)
+    if qr_img is None:
+        qr_img = make_qr_image(qr_text, correction_level, qr_size, qr_fill, mode)
+        qr_cache().put(qr_key, qr_img)
+
+    # Position QR code on the right
+    qr_x = width - qr_size - margin
+    qr_y = (height - qr_size) // 2
+    label.paste(qr_img, (qr_x, qr_y))
+
+    # Calculate text position
+    text_area_width = qr_x - margin * 2
+    text_area_height = height - margin * 2
+
+    # Wrap text and pick the font size (cached per distinct text and layout)
+    font, current_size, lines, line_height = fit_text(draw, label_text, font_size,
+                                                      text_area_width, text_area_height)
+
+    # Draw text
     line_spacing = line_height * 0.1  # 10% of line height
     total_text_height = len(lines) * line_height + (len(lines) - 1) * line_spacing
 
@@ -329,6 +511,95 @@ def file_reader(file):
     
     return data
 
+#########################################
+# Validate QR payloads before rendering #
+#########################################
+
+MAX_QR_VERSION = 40  # Largest version in the QR standard
+MIN_MODULE_PX = 2    # Smaller modules are hard to print and scan
+
+def qr_data_bits(mode, length):
+    """Bits needed for length characters of data in the given QR encoding mode."""
+    if mode == qrcode.util.MODE_NUMBER:
+        return 10 * (length // 3) + (0, 4, 7)[length % 3]  # 3 digits per 10 bits
+    if mode == qrcode.util.MODE_ALPHA_NUM:
+        return 11 * (length // 2) + 6 * (length % 2)       # 2 characters per 11 bits
+    return 8 * length
+
+def qr_capacity(version, correction_level='H', mode=qrcode.util.MODE_8BIT_BYTE):
+    """Number of characters (bytes in byte mode) a QR code of the given version, level and mode can hold."""
+    level = QR_ERROR_LEVELS.get(correction_level, qrcode.constants.ERROR_CORRECT_H)
+    bits = qrcode.util.BIT_LIMIT_TABLE[level][version] - 4 - qrcode.util.length_in_bits(mode, version)
+    if mode == qrcode.util.MODE_NUMBER:
+        return 3 * (bits // 10) + (2 if bits % 10 >= 7 else 1 if bits % 10 >= 4 else 0)
+    if mode == qrcode.util.MODE_ALPHA_NUM:
+        return 2 * (bits // 11) + (1 if bits % 11 >= 6 else 0)
+    return bits // 8
+
+def qr_mode(qr_text):
+    """Encoding mode and length of qr_text as generate_label adds it (UTF-8, one segment)."""
+    data = qr_text.encode('utf-8')
+    return qrcode.util.optimal_mode(data), len(data)
+
+def qr_version(qr_text, correction_level='H'):
+    """
+    Smallest QR version that holds qr_text, or None if it does not fit in version 40.
+
+    generate_label adds the UTF-8 bytes as one segment, and qrcode picks the
+    numeric, alphanumeric or byte mode for it. The same bit count is done
+    here without building a QR matrix.
+    """
+    mode, length = qr_mode(qr_text)
+    limits = qrcode.util.BIT_LIMIT_TABLE[QR_ERROR_LEVELS.get(correction_level, qrcode.constants.ERROR_CORRECT_H)]
+    data_bits = qr_data_bits(mode, length)
+
+    # The length field grows at versions 10 and 27; retry until the guess is stable
+    version = 1
+    while True:
+        needed = 4 + qrcode.util.length_in_bits(mode, version) + data_bits
+        fit = bisect.bisect_left(limits, needed, version)
+        if fit > MAX_QR_VERSION:
+            return None
+        if qrcode.util.length_in_bits(mode, fit) == qrcode.util.length_in_bits(mode, version):
+            return fit
+        version = fit
+
+def validate_payloads(data, correction_level='H', qr_size=185, max_version=MAX_QR_VERSION):
+    '''
+    Check every row's QR payload without rendering.
+
+    Rows whose payload needs more than max_version are "too large"; rows that
+    fit but would print with modules under MIN_MODULE_PX pixels at qr_size are
+    "too dense". Returns a per-file summary dict.
+    '''
+    capacity = qr_capacity(max_version, correction_level)
+    too_large = []  # (row number, label, payload bytes, bytes that fit for this payload's mode)
+    too_dense = []  # (row number, label, version, module size in px)
+    highest = 0
+
+    for idx, (vis, qr_text) in enumerate(data, 1):
+        version = qr_version(qr_text, correction_level)
+
+        if version is None or version > max_version:
+            mode, length = qr_mode(qr_text)
+            too_large.append((idx, vis, length, qr_capacity(max_version, correction_level, mode)))
+            continue
+
+        highest = max(highest, version)
+        modules = 17 + 4 * version + 2 * QR_BORDER
+        module_px = qr_size / modules
+        if module_px < MIN_MODULE_PX:
+            too_dense.append((idx, vis, version, module_px))
+
+    return {
+        'rows': len(data),
+        'capacity': capacity,
+        'max_version': max_version,
+        'highest_version': highest,
+        'too_large': too_large,
+        'too_dense': too_dense,
+    }
+
 ###########################
 # Group labels into grids #
 ###########################
@@ -341,6 +612,7 @@ def group_labels(labels, rows=3, cols=2, spacing=20):
     
     label_width = labels[0].width
     label_height = labels[0].height
+    mode = labels[0].mode  # Keep the labels' color mode for the page
 
     grid_width = cols * label_width + (cols + 1) * spacing
     grid_height = rows * label_height + (rows + 1) * spacing
@@ -349,7 +621,7 @@ def group_labels(labels, rows=3, cols=2, spacing=20):
     num_grids = (len(labels) + labels_per_grid - 1) // labels_per_grid
 
     for i in range(num_grids):
-        grid = Image.new('RGBA', (grid_width, grid_height), color=(255, 255, 255, 255))
+        grid = Image.new(mode, (grid_width, grid_height), color=mode_color(WHITE, mode))
 
         start = i * labels_per_grid
         end = min((i + 1) * labels_per_grid, len(labels))
@@ -372,17 +644,454 @@ def group_labels(labels, rows=3, cols=2, spacing=20):
 ## Create PDF from grids ##
 ###########################
 
-def create_pdf(grids, dpi=150, qual=95):
-    if not grids:
+class PageSequence(Image.Image):
+    '''
+    Multi-frame image whose frames are taken from an iterator of pages, so
+    that save_all encodes every page in one pass while holding only the
+    current one.
+    '''
+
+    def __init__(self, pages, n_frames):
+        super().__init__()
+        self._pages = iter(pages)
+        self._frame = -1
+        self.n_frames = n_frames
+        self.seek(0)
+
+    def seek(self, frame):
+        if not 0 <= frame < self.n_frames or frame < self._frame:
+            raise EOFError("pages can only be read forward")
+        while self._frame < frame:
+            page = next(self._pages)
+            self.im, self._mode, self._size = page.im, page.mode, page.size
+            self._frame += 1
+
+    def tell(self):
+        return self._frame
+
+def create_pdf(grids, dpi=150, qual=95, num_pages=None):
+    '''
+    Encode grids into a PDF. With num_pages, grids may be any iterable of
+    that many pages; they are encoded as they are produced, so only one
+    page has to be in memory.
+    '''
+    if num_pages is None:
+        grids = list(grids)
+        num_pages = len(grids)
+    if not num_pages:
         return None
-    
+
+    pages = PageSequence(grids, num_pages)
     pdf_bytes = io.BytesIO()
-    grids[0].save(pdf_bytes, format='PDF', save_all=True, append_images=grids[1:],
-                  resolution=dpi, quality=qual)
+
+    # Bilevel pages are stored with CCITT compression, which takes no quality setting
+    options = {} if pages.mode == '1' else {'quality': qual}
+    pages.save(pdf_bytes, format='PDF', save_all=True, resolution=dpi, **options)
+
     pdf_bytes.seek(0)
     
     return pdf_bytes
 
+########################################
+# Compact label store with lazy pixels #
+########################################
+
+# Per-session memory limits
+SESSION_CACHE_BYTES = 64 * 1024 * 1024    # Rendered pages + PDF kept per session
+GLOBAL_CACHE_BYTES = 512 * 1024 * 1024    # Same budget, summed over all sessions
+EXPORT_BATCH_BYTES = 32 * 1024 * 1024     # Page pixels rendered ahead while exporting
+
+
+class LabelRecord:
+    """One parsed input row: visible label text and QR payload."""
+    __slots__ = ('label_text', 'qr_text')
+
+    def __init__(self, label_text, qr_text):
+        self.label_text = label_text
+        self.qr_text = qr_text
+
+
+def image_nbytes(img):
+    """Approximate memory used by the pixel data of an image."""
+    # PIL keeps single-band modes ('1', 'L') at 1 byte per pixel, others at 4
+    return img.width * img.height * (1 if len(img.getbands()) == 1 else 4)
+
+
+@st.cache_resource
+def session_registry():
+    """Label stores of all live sessions, least recently used first."""
+    return {'lock': threading.Lock(), 'stores': OrderedDict()}
+
+
+def render_page(records, layout, grid):
+    """Render one page of labels (module level so pool workers can run it)."""
+    rows, cols, spacing = grid
+    labels = [generate_label(record.label_text, record.qr_text, **layout) for record in records]
+    return group_labels(labels, rows, cols, spacing)[0]
+
+
+class LabelStore:
+    '''
+    Parsed rows plus the layout needed to draw them.
+
+    Labels are kept as descriptions (record + shared layout) instead of
+    pixels. Pages are rendered on demand into a small LRU cache limited by
+    SESSION_CACHE_BYTES; GLOBAL_CACHE_BYTES limits all sessions together by
+    evicting cached pages from the least recently used sessions first.
+
+    Rows from several files are kept in sections, and each section starts
+    on a new page so it can be exported as part of a merged PDF or alone.
+
+    Other sessions may evict this store's cache from their own threads, so
+    the cache and its byte count are only touched while holding _lock.
+    The lock is never held while rendering or while taking another lock.
+    '''
+    __slots__ = ('records', 'layout', 'grid', 'sections', '_page_ranges', '_section_pages',
+                 '_pages', '_export', '_cached_bytes', '_lock', '__weakref__')
+
+    def __init__(self, records, layout, grid, sections=None):
+        self.records = records      # list of LabelRecord
+        self.layout = layout        # generate_label keyword arguments
+        self.grid = grid            # (rows, cols, spacing)
+        self.sections = sections or [('labels', 0, len(records))]  # (name, start, end) per file
+        self._pages = OrderedDict() # page index -> rendered page
+        self._export = None         # (dpi, qual, per_file, bytes) of the last export
+        self._cached_bytes = 0
+        self._lock = threading.Lock()
+
+        # Record range of every page and page range of every section
+        self._page_ranges = []
+        self._section_pages = []
+        for name, start, end in self.sections:
+            first_page = len(self._page_ranges)
+            for page_start in range(start, end, self.labels_per_page):
+                self._page_ranges.append((page_start, min(page_start + self.labels_per_page, end)))
+            self._section_pages.append((name, range(first_page, len(self._page_ranges))))
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def labels_per_page(self):
+        rows, cols, _ = self.grid
+        return rows * cols
+
+    @property
+    def num_pages(self):
+        return len(self._page_ranges)
+
+    @property
+    def cached_bytes(self):
+        return self._cached_bytes
+
+    def render_label(self, idx):
+        record = self.records[idx]
+        return generate_label(record.label_text, record.qr_text, **self.layout)
+
+    def _page_job(self, page_idx):
+        start, end = self._page_ranges[page_idx]
+        return self.records[start:end], self.layout, self.grid
+
+    def page(self, page_idx):
+        """Rendered page, kept in the session cache for later previews."""
+        self._touch()
+        with self._lock:
+            page = self._pages.get(page_idx)
+            if page is not None:
+                self._pages.move_to_end(page_idx)
+                return page
+
+        page = render_page(*self._page_job(page_idx))
+        with self._lock:
+            if page_idx not in self._pages:
+                self._pages[page_idx] = page
+                self._cached_bytes += image_nbytes(page)
+            self._shrink(SESSION_CACHE_BYTES)
+        enforce_global_budget(self)
+        return page
+
+    def iter_pages(self, page_indices=None, pool=None, batch_size=None):
+        '''
+        Yield pages in order for export without growing the cache, rendering
+        on pool if given. With batch_size, at most that many pages are
+        rendered ahead of the consumer.
+        '''
+        if page_indices is None:
+            page_indices = range(self.num_pages)
+        page_indices = list(page_indices)
+        step = batch_size or max(1, len(page_indices))
+
+        for chunk_start in range(0, len(page_indices), step):
+            chunk = page_indices[chunk_start:chunk_start + step]
+            with self._lock:
+                cached = {idx: self._pages[idx] for idx in chunk if idx in self._pages}
+            missing = [idx for idx in chunk if idx not in cached]
+
+            if pool is not None and len(missing) > 1:
+                jobs = [self._page_job(idx) for idx in missing]
+                rendered = pool.map(render_page, *zip(*jobs))
+            else:
+                rendered = (render_page(*self._page_job(idx)) for idx in missing)
+
+            for idx in chunk:
+                yield cached[idx] if idx in cached else next(rendered)
+
+    def export_batch_size(self):
+        """Pages per export batch so that one batch stays under EXPORT_BATCH_BYTES."""
+        if not self.num_pages:
+            return 1
+        return max(1, EXPORT_BATCH_BYTES // image_nbytes(self.page(0)))
+
+    def section_pdfs(self, dpi=150, qual=95, pool=None):
+        """Yield (section name, PDF bytes) for every input file."""
+        batch_size = self.export_batch_size()
+        for name, page_indices in self._section_pages:
+            pages = self.iter_pages(page_indices, pool, batch_size)
+            pdf_bytes = create_pdf(pages, dpi=dpi, qual=qual, num_pages=len(page_indices))
+            if pdf_bytes is not None:
+                yield name, pdf_bytes.getvalue()
+
+    def cached_export(self, dpi=150, qual=95, per_file=False):
+        """Bytes of the last export if it used these settings, otherwise None."""
+        with self._lock:
+            if self._export is not None and self._export[:3] == (dpi, qual, per_file):
+                return self._export[3]
+        return None
+
+    def export(self, dpi=150, qual=95, per_file=False, pool=None):
+        '''
+        Merged PDF of all pages, or a ZIP with one PDF per file when per_file
+        is set. Pages are rendered in batches of at most EXPORT_BATCH_BYTES of
+        pixels and encoded one by one. The last export is cached (compressed).
+        '''
+        self._touch()
+        with self._lock:
+            if self._export is not None and self._export[:3] == (dpi, qual, per_file):
+                return self._export[3]
+            self._drop_export()
+
+        if per_file:
+            zip_bytes = io.BytesIO()
+            with zipfile.ZipFile(zip_bytes, 'w') as archive:
+                for name, data in self.section_pdfs(dpi, qual, pool):
+                    archive.writestr(f"{os.path.splitext(name)[0]}.pdf", data)
+            data = zip_bytes.getvalue()
+        else:
+            batch_size = self.export_batch_size()
+            pages = self.iter_pages(pool=pool, batch_size=batch_size)
+            pdf_bytes = create_pdf(pages, dpi=dpi, qual=qual, num_pages=self.num_pages)
+            if pdf_bytes is None:
+                return None
+            data = pdf_bytes.getvalue()
+
+        if len(data) <= SESSION_CACHE_BYTES:
+            with self._lock:
+                self._drop_export()
+                self._export = (dpi, qual, per_file, data)
+                self._cached_bytes += len(data)
+                self._shrink(SESSION_CACHE_BYTES)
+            enforce_global_budget(self)
+        return data
+
+    def _drop_export(self):
+        # Caller holds self._lock
+        if self._export is not None:
+            self._cached_bytes -= len(self._export[3])
+            self._export = None
+
+    def shrink(self, limit):
+        """Evict cached pages (oldest first), then the export, until under limit."""
+        with self._lock:
+            self._shrink(limit)
+
+    def _shrink(self, limit):
+        # Caller holds self._lock
+        while self._cached_bytes > limit and self._pages:
+            _, page = self._pages.popitem(last=False)
+            self._cached_bytes -= image_nbytes(page)
+        if self._cached_bytes > limit:
+            self._drop_export()
+
+    def clear(self):
+        self.shrink(0)
+
+    def _touch(self):
+        registry = session_registry()
+        key = id(self)
+        with registry['lock']:
+            stores = registry['stores']
+            if key not in stores or stores[key]() is not self:
+                stores[key] = weakref.ref(self)
+            stores.move_to_end(key)
+
+
+def enforce_global_budget(current):
+    """Evict caches of the least recently used sessions to stay under GLOBAL_CACHE_BYTES."""
+    registry = session_registry()
+    with registry['lock']:
+        stores = registry['stores']
+        live = []
+        for key, ref in list(stores.items()):
+            store = ref()
+            if store is None:
+                del stores[key]  # Session ended
+            else:
+                live.append(store)
+
+    # Evict outside the registry lock; each store takes its own lock in clear()
+    total = sum(store.cached_bytes for store in live)
+    for store in live:
+        if total <= GLOBAL_CACHE_BYTES:
+            break
+        if store is current:
+            continue
+        total -= store.cached_bytes
+        store.clear()
+        total += store.cached_bytes
+
+    if total > GLOBAL_CACHE_BYTES:
+        current.shrink(current.cached_bytes - (total - GLOBAL_CACHE_BYTES))
+
+################################################
+# Batch mode: many files, one shared worker pool #
+################################################
+
+MAX_WORKERS = min(8, os.cpu_count() or 1)
+BATCH_EXTENSIONS = ('.csv', '.tsv', '.txt')
+
+# Same defaults as the web app sidebar
+DEFAULT_LAYOUT = dict(width=600, height=200, margin=15, font_size=50, qr_size=180,
+                      draw_border=True, border_width=4, border_margin=5, correction_level='H')
+
+@st.cache_resource
+def render_pool():
+    """Worker threads shared by all sessions, so fonts and caches stay warm between uploads."""
+    return ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='qrlabels')
+
+def build_store(files, layout, grid):
+    """LabelStore for several (file name, rows) inputs, one section per file."""
+    records = []
+    sections = []
+    for name, rows in files:
+        # Per-file outputs are named <stem>.pdf, so keep stems unique (ignoring case,
+        # for case-insensitive file systems) or s.csv and s.txt would overwrite each other
+        base, ext = os.path.splitext(name)
+        stem, copy = base, 1
+        while any(os.path.splitext(section[0])[0].lower() == stem.lower() for section in sections):
+            copy += 1
+            stem = f"{base}_{copy}"
+        name = stem + ext
+
+        start = len(records)
+        records.extend(LabelRecord(vis, qr) for vis, qr in rows)
+        sections.append((name, start, len(records)))
+    return LabelStore(records, layout, grid, sections)
+
+def expand_inputs(paths):
+    """Input files from file paths, directories and glob patterns, in order and without duplicates."""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            matches = [os.path.join(path, name) for name in sorted(os.listdir(path))]
+            matches = [m for m in matches if m.lower().endswith(BATCH_EXTENSIONS)]
+        elif os.path.isfile(path):
+            matches = [path]
+        else:
+            matches = [m for m in sorted(glob.glob(path)) if m.lower().endswith(BATCH_EXTENSIONS)]
+            if not matches:
+                print(f"! No input files match: {path}")
+
+        for match in matches:
+            if os.path.isfile(match) and match not in found:
+                found.append(match)
+    return found
+
+def int_between(low, high=None):
+    """argparse type for integers from low to high (no upper bound if high is None)."""
+    def parse(value):
+        try:
+            number = int(value)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"invalid integer: '{value}'")
+        if number < low or (high is not None and number > high):
+            bounds = f"at least {low}" if high is None else f"from {low} to {high}"
+            raise argparse.ArgumentTypeError(f"must be {bounds}, got {number}")
+        return number
+    return parse
+
+def main(argv=None):
+    """Headless batch mode: python qrlabels.py INPUT [INPUT ...] [options]"""
+    parser = argparse.ArgumentParser(description="Generate QR labels from CSV, TSV or TXT files without the web app.")
+    parser.add_argument('inputs', nargs='+', help="Input files, directories or glob patterns (quote them)")
+    parser.add_argument('-o', '--output',
+                        help="Merged PDF path, or output directory with --per-file (default: labels.pdf or labels/)")
+    parser.add_argument('--per-file', action='store_true', help="Write one PDF per input file instead of one merged PDF")
+    parser.add_argument('--correction-level', choices=list(QR_ERROR_LEVELS), default='H', help="QR error correction level")
+    parser.add_argument('--max-qr-version', type=int, default=MAX_QR_VERSION, choices=range(1, MAX_QR_VERSION + 1),
+                        metavar='1-40', help="Reject rows whose QR data needs a larger version")
+    parser.add_argument('--skip-invalid', action='store_true', help="Skip rows with too much QR data instead of stopping")
+    parser.add_argument('--rows', type=int_between(1), default=3, help="Rows of labels per page")
+    parser.add_argument('--cols', type=int_between(1), default=2, help="Columns of labels per page")
+    parser.add_argument('--dpi', type=int_between(1), default=150)
+    parser.add_argument('--quality', type=int_between(1, 100), default=95)
+    parser.add_argument('--workers', type=int_between(1), default=MAX_WORKERS, help="Worker processes shared by all files")
+    args = parser.parse_args(argv)
+    if args.output is None:
+        args.output = 'labels' if args.per_file else 'labels.pdf'
+    elif args.per_file and args.output.lower().endswith('.pdf'):
+        parser.error(f"--per-file writes one PDF per input into a directory; -o {args.output} looks like a PDF file")
+
+    paths = expand_inputs(args.inputs)
+    if not paths:
+        print("! No input files found")
+        return 1
+
+    layout = dict(DEFAULT_LAYOUT, correction_level=args.correction_level)
+
+    # Parse and validate every file before rendering anything
+    files = []
+    rejected = False
+    for path in paths:
+        with open(path, 'rb') as f:
+            rows = file_reader(f)
+        report = validate_payloads(rows, args.correction_level, layout['qr_size'], args.max_qr_version)
+        print(f"> {path}: {report['rows']} rows, highest QR version {report['highest_version']}, "
+              f"{len(report['too_large'])} too large, {len(report['too_dense'])} too dense")
+        for idx, vis, size, capacity in report['too_large']:
+            print(f"- row {idx} '{vis}': {size} bytes, at most {capacity} fit")
+
+        if report['too_large']:
+            if args.skip_invalid:
+                too_large_rows = {idx for idx, *_ in report['too_large']}
+                rows = [row for idx, row in enumerate(rows, 1) if idx not in too_large_rows]
+            else:
+                rejected = True
+        files.append((os.path.basename(path), rows))
+
+    if rejected:
+        print("! Some rows have too much QR data. Fix them, raise --max-qr-version or use --skip-invalid.")
+        return 1
+
+    store = build_store(files, layout, (args.rows, args.cols, 20))
+    if not len(store):
+        print("! No labels found")
+        return 1
+
+    # One pool for all files: workers start once and keep their font and QR caches warm
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        if args.per_file:
+            os.makedirs(args.output, exist_ok=True)
+            for name, data in store.section_pdfs(args.dpi, args.quality, pool):
+                out_path = os.path.join(args.output, f"{os.path.splitext(name)[0]}.pdf")
+                with open(out_path, 'wb') as f:
+                    f.write(data)
+                print(f"> Wrote {out_path}")
+        else:
+            with open(args.output, 'wb') as f:
+                f.write(store.export(args.dpi, args.quality, pool=pool))
+            print(f"> Wrote {args.output}: {len(store)} labels, {store.num_pages} pages from {len(files)} files")
+    return 0
+
 
 def get_current_params():
     """Get current parameters as a tuple for comparison"""
@@ -402,6 +1111,7 @@ def get_current_params():
         st.session_state.get('grid_rows'),
         st.session_state.get('grid_cols'),
         st.session_state.get('grid_spacing'),
+        st.session_state.get('max_qr_version'),
     )
 
 
@@ -409,12 +1119,14 @@ def get_current_params():
 ## Streamlit web app ##
 ########################
 
+def run_app():
+    """Streamlit web app; only runs under `streamlit run`."""
 
-st.set_page_config(page_title="QRLabels", page_icon="✨", layout="wide")
+    st.set_page_config(page_title="QRLabels", page_icon="✨", layout="wide")
 
-st.title("QRLabels   ദ്ദി(˵ •̀ ᴗ - ˵ ) ✧ ")
+    st.title("QRLabels   ദ്ദി(˵ •̀ ᴗ - ˵ ) ✧ ")
 
-github_badge_text = """
+    github_badge_text = """
 <div style="position: fixed; top: 70px; right: 20px; z-index: 999;">
     <a href="https://github.com/mariameraz/qrlabel" target="_blank" style="text-decoration: none;">
         <div style="background: #24292e; color: white; padding: 8px 16px; border-radius: 20px; 
@@ -428,11 +1140,11 @@ github_badge_text = """
     </a>
 </div>
 """
-st.markdown(github_badge_text, unsafe_allow_html=True)
+    st.markdown(github_badge_text, unsafe_allow_html=True)
 
-with st.expander("**✨👇 Generate Custom Labels with QR Codes**", expanded=True):
-    st.info("""
-    Create personalized labels for your samples with custom text and unique QR codes by uploading a CSV, TXT, or TSV file.
+    with st.expander("**✨👇 Generate Custom Labels with QR Codes**", expanded=True):
+        st.info("""
+    Create personalized labels for your samples with custom text and unique QR codes by uploading one or more CSV, TXT, or TSV files.
 
     File format:
 
@@ -455,10 +1167,10 @@ with st.expander("**✨👇 Generate Custom Labels with QR Codes**", expanded=Tr
 
     """)
 
-st.markdown("---")
-with st.sidebar:
-    # Buy the planet a tree button (mantener como está)
-    st.markdown("""
+    st.markdown("---")
+    with st.sidebar:
+        # Buy the planet a tree button (mantener como está)
+        st.markdown("""
     <style>
     .tree-button {
         background: rgba(206, 156, 156, 0.8);
@@ -495,140 +1207,180 @@ with st.sidebar:
     </a>
     """, unsafe_allow_html=True)
     
-    st.markdown("---")
+        st.markdown("---")
     
-    # Sección Label format - COLAPSABLE
-    with st.expander("⟡ Label format ˎˊ˗", expanded=True):
-        size1, size2 = st.columns(2)
-        with size1:
-            label_width = st.number_input("Width (px)", min_value=100, max_value=2000, value=600, step=10)
-        with size2:
-            label_height = st.number_input("Height (px)", min_value=50, max_value=1000, value=200, step=10)
+        # Sección Label format - COLAPSABLE
+        with st.expander("⟡ Label format ˎˊ˗", expanded=True):
+            size1, size2 = st.columns(2)
+            with size1:
+                label_width = st.number_input("Width (px)", min_value=100, max_value=2000, value=600, step=10)
+            with size2:
+                label_height = st.number_input("Height (px)", min_value=50, max_value=1000, value=200, step=10)
         
-        font, qrsize = st.columns(2)
-        with font:
-            font_size = st.number_input("Font Size", min_value=10, max_value=200, value=50, step=1)
-        with qrsize:
-            qr_size = st.number_input("QR Code Size (px)", min_value=50, max_value=500, value=180, step=5)
+            font, qrsize = st.columns(2)
+            with font:
+                font_size = st.number_input("Font Size", min_value=10, max_value=200, value=50, step=1)
+            with qrsize:
+                qr_size = st.number_input("QR Code Size (px)", min_value=50, max_value=500, value=180, step=5)
         
-        mar, corr = st.columns(2)
-        with mar:
-            margin = st.number_input("Margin (px)", min_value=0, max_value=100, value=15, step=1)
-        with corr:
-            correction_level = st.selectbox("QR Error Level", options=['L (7%)', 'M (15%)', 'Q (25%)', 'H (30%)'], index=3,
-                                           help="Error correction level determines how much damage the QR can sustain. Higher levels make the QR code more resistant to damage but store less data.")
+            mar, corr = st.columns(2)
+            with mar:
+                margin = st.number_input("Margin (px)", min_value=0, max_value=100, value=15, step=1)
+            with corr:
+                correction_level = st.selectbox("QR Error Level", options=['L (7%)', 'M (15%)', 'Q (25%)', 'H (30%)'], index=3,
+                                               help="Error correction level determines how much damage the QR can sustain. Higher levels make the QR code more resistant to damage but store less data.")
+
+            max_qr_version = st.number_input("Max QR Version", min_value=1, max_value=MAX_QR_VERSION, value=MAX_QR_VERSION, step=1,
+                                             help="Rows whose QR data needs a larger (denser) QR code are rejected before the labels are generated.")
         
-        # Border
-        draw_border = st.checkbox("Draw Border", value=True)
-        if draw_border:
-            bw, bm = st.columns(2)
-            with bw:
-                border_width = st.number_input("Border Width (px)", min_value=1, max_value=20, value=4, step=1)
-            with bm:
-                border_margin = st.number_input("Border Margin (px)", min_value=0, max_value=50, value=5, step=1)
-        else:
-            border_width = 0
-            border_margin = 0
+            # Border
+            draw_border = st.checkbox("Draw Border", value=True)
+            if draw_border:
+                bw, bm = st.columns(2)
+                with bw:
+                    border_width = st.number_input("Border Width (px)", min_value=1, max_value=20, value=4, step=1)
+                with bm:
+                    border_margin = st.number_input("Border Margin (px)", min_value=0, max_value=50, value=5, step=1)
+            else:
+                border_width = 0
+                border_margin = 0
     
-    # Sección Colors - COLAPSABLE
-    with st.expander("⟡ Colors ˎˊ˗", expanded=True):
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            qr_color = st.color_picker("QR Code", value="#000000")
-            qr_opacity = int(st.slider("QR Opacity", min_value=0, max_value=100, value=100) * 2.55)
-        with col2:
-            label_text_color = st.color_picker("Label Text", value="#000000")
-            text_opacity = int(st.slider("Text Opacity", min_value=0, max_value=100, value=100) * 2.55)
-        with col3:
-            label_color = st.color_picker("Background", value="#FFFFFF")
-            bg_opacity = int(st.slider("BG Opacity", min_value=0, max_value=100, value=100) * 2.55)
+        # Sección Colors - COLAPSABLE
+        with st.expander("⟡ Colors ˎˊ˗", expanded=True):
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                qr_color = st.color_picker("QR Code", value="#000000")
+                qr_opacity = round(st.slider("QR Opacity", min_value=0, max_value=100, value=100) * 255 / 100)
+            with col2:
+                label_text_color = st.color_picker("Label Text", value="#000000")
+                text_opacity = round(st.slider("Text Opacity", min_value=0, max_value=100, value=100) * 255 / 100)
+            with col3:
+                label_color = st.color_picker("Background", value="#FFFFFF")
+                bg_opacity = round(st.slider("BG Opacity", min_value=0, max_value=100, value=100) * 255 / 100)
     
-    # Convert hex colors to RGBA
-    def hex_to_rgba(hex_color, opacity):
-        rgb = tuple(int(hex_color.lstrip('#')[i:i+2], 16) for i in (0, 2, 4))
-        return rgb + (opacity,)
+        # Convert hex colors to RGBA
+        def hex_to_rgba(hex_color, opacity):
+            rgb = tuple(int(hex_color.lstrip('#')[i:i+2], 16) for i in (0, 2, 4))
+            return rgb + (opacity,)
     
-    qr_color_rgba = hex_to_rgba(qr_color, qr_opacity)
-    label_text_color_rgba = hex_to_rgba(label_text_color, text_opacity)
-    label_color_rgba = hex_to_rgba(label_color, bg_opacity)
-    border_color_rgba = (0, 0, 0, 255)
+        qr_color_rgba = hex_to_rgba(qr_color, qr_opacity)
+        label_text_color_rgba = hex_to_rgba(label_text_color, text_opacity)
+        label_color_rgba = hex_to_rgba(label_color, bg_opacity)
+        border_color_rgba = (0, 0, 0, 255)
     
-    # Sección Grid - COLAPSABLE
-    with st.expander("⟡ Grid ˎˊ˗", expanded=True):
-        grid_spacing = st.number_input("Spacing between labels (px)", min_value=0, max_value=100, value=20, step=1)
+        # Sección Grid - COLAPSABLE
+        with st.expander("⟡ Grid ˎˊ˗", expanded=True):
+            grid_spacing = st.number_input("Spacing between labels (px)", min_value=0, max_value=100, value=20, step=1)
         
-        page_width_px = int(8.5 * 150)
-        page_height_px = int(11 * 150)
+            page_width_px = int(8.5 * 150)
+            page_height_px = int(11 * 150)
         
-        max_cols = max(1, (page_width_px - grid_spacing) // (label_width + grid_spacing))
-        max_rows = max(1, (page_height_px - grid_spacing) // (label_height + grid_spacing))
-        labels_per_page = max_cols * max_rows
+            max_cols = max(1, (page_width_px - grid_spacing) // (label_width + grid_spacing))
+            max_rows = max(1, (page_height_px - grid_spacing) // (label_height + grid_spacing))
         
-        grow, gcol = st.columns(2)
-        with grow:
-            grid_rows = st.number_input("Labels per row", min_value=1, max_value=20, 
-                                        value=min(3, max_rows), step=1)
-        with gcol:
-            grid_cols = st.number_input("Labels per column", min_value=1, max_value=10, 
-                                        value=min(2, max_cols), step=1)
+            grow, gcol = st.columns(2)
+            with grow:
+                grid_rows = st.number_input("Labels per row", min_value=1, max_value=20, 
+                                            value=min(3, max_rows), step=1)
+            with gcol:
+                grid_cols = st.number_input("Labels per column", min_value=1, max_value=10, 
+                                            value=min(2, max_cols), step=1)
             
-# Store current params in session state for comparison
-current_params = (label_width, label_height, font_size, qr_size, margin, correction_level,
-                 draw_border, border_width, border_margin, qr_color_rgba, label_text_color_rgba,
-                 label_color_rgba, grid_rows, grid_cols, grid_spacing)
-
-# Main area
-col_upload, col_preview = st.columns([1, 1])
-
-with col_upload:
-    st.subheader("📤 Upload your file")
-    uploaded_file = st.file_uploader("Upload a file with your labels:", type=['csv', 'tsv', 'txt'], key="file_uploader")
+    # Store current params in session state for comparison
+    current_params = (label_width, label_height, font_size, qr_size, margin, correction_level,
+                     draw_border, border_width, border_margin, qr_color_rgba, label_text_color_rgba,
+                     label_color_rgba, grid_rows, grid_cols, grid_spacing, max_qr_version)
+
+    # Main area
+    col_upload, col_preview = st.columns([1, 1])
+
+    with col_upload:
+        st.subheader("📤 Upload your files")
+        uploaded_files = st.file_uploader("Upload one or more files with your labels:", type=['csv', 'tsv', 'txt'],
+                                          accept_multiple_files=True, key="file_uploader")
     
-    if uploaded_file:
-        st.success("✅ File uploaded successfully!")
-
-        data_list = file_reader(uploaded_file)
+        if uploaded_files:
+            st.success(f"✅ {len(uploaded_files)} file(s) uploaded successfully!")
 
-        if data_list:
-            #st.info(f"ℹ️ {len(data_list)} labels found in the file.")
+            files = [(uploaded_file.name, file_reader(uploaded_file)) for uploaded_file in uploaded_files]
 
-            with st.expander("Preview file data"):
-                for idx, (vis, qr) in enumerate(data_list[:10], 1):
-                    qr_prev = qr.replace('\n', ' | ')[:50]
-                    st.text(f"{idx}. Label: '{vis}' | QR: {qr_prev}")
-                if len(data_list) > 10:
-                    st.text(f"... +{len(data_list)-10} more")
+            # Check QR payloads of every file before rendering anything
+            reports = [(name, validate_payloads(rows, correction_level[0], qr_size, max_qr_version))
+                       for name, rows in files]
 
-            # Check if parameters changed
-            params_changed = False
-            file_changed = False
+            if any(report['too_large'] for _, report in reports):
+                for name, report in reports:
+                    if not report['too_large']:
+                        continue
+                    st.error(f"> {name}: {len(report['too_large'])} of {report['rows']} rows have too much QR data: "
+                             f"at most {report['capacity']} bytes of text (more if only digits or uppercase letters) "
+                             f"fit in a version {report['max_version']} QR code with error level {correction_level}.")
+                    with st.expander(f"Rows with too much QR data in {name}"):
+                        for idx, vis, size, capacity in report['too_large'][:50]:
+                            st.text(f"{idx}. Label: '{vis}' | {size} bytes, at most {capacity} fit")
+                        if len(report['too_large']) > 50:
+                            st.text(f"... +{len(report['too_large'])-50} more")
+
+                if st.checkbox("Skip these rows and generate the rest", value=False, key="skip_too_large"):
+                    for i, ((name, rows), (_, report)) in enumerate(zip(files, reports)):
+                        too_large_rows = {idx for idx, *_ in report['too_large']}
+                        files[i] = (name, [row for idx, row in enumerate(rows, 1) if idx not in too_large_rows])
+                else:
+                    files = []
+
+            if files:
+                for name, report in reports:
+                    if not report['too_dense']:
+                        continue
+                    st.warning(f"> {name}: {len(report['too_dense'])} QR codes will have modules under {MIN_MODULE_PX} px "
+                               f"and may not scan. Increase the QR Code Size or shorten their data.")
+                    with st.expander(f"Rows with dense QR codes in {name}"):
+                        for idx, vis, version, module_px in report['too_dense'][:50]:
+                            st.text(f"{idx}. Label: '{vis}' | version {version} | {module_px:.1f} px per module")
+                        if len(report['too_dense']) > 50:
+                            st.text(f"... +{len(report['too_dense'])-50} more")
+
+            files = [(name, rows) for name, rows in files if rows]
+
+            if files:
+                #st.info(f"ℹ️ {len(data_list)} labels found in the file.")
+
+                with st.expander("Preview file data"):
+                    for name, data_list in files:
+                        if len(files) > 1:
+                            st.markdown(f"**{name}** ({len(data_list)} labels)")
+                        for idx, (vis, qr) in enumerate(data_list[:10], 1):
+                            qr_prev = qr.replace('\n', ' | ')[:50]
+                            st.text(f"{idx}. Label: '{vis}' | QR: {qr_prev}")
+                        if len(data_list) > 10:
+                            st.text(f"... +{len(data_list)-10} more")
+
+                # Check if parameters changed
+                params_changed = False
+                file_changed = False
             
-            # Create unique file identifier
-            current_file_id = f"{uploaded_file.name}_{uploaded_file.size}"
+                # Create unique identifier of the files (row counts change when invalid rows are skipped)
+                current_file_id = "|".join(f"{uploaded_file.name}_{uploaded_file.size}" for uploaded_file in uploaded_files)
+                current_file_id += f"_{sum(len(rows) for _, rows in files)}"
             
-            # Check if it's a new file
-            if 'last_file_id' not in st.session_state or st.session_state['last_file_id'] != current_file_id:
-                file_changed = True
-                st.session_state['last_file_id'] = current_file_id
+                # Check if it's a new file
+                if 'last_file_id' not in st.session_state or st.session_state['last_file_id'] != current_file_id:
+                    file_changed = True
+                    st.session_state['last_file_id'] = current_file_id
             
-            # Check if parameters changed
-            if 'last_params' in st.session_state:
-                if st.session_state['last_params'] != current_params and 'labels' in st.session_state:
-                    params_changed = True
-
-            # Auto-regenerate if file is new, parameters changed, or no labels exist yet
-            if file_changed or params_changed or 'labels' not in st.session_state:
-                #if params_changed and auto_update:
-                #    st.info("🔄 Parameters changed - auto-updating labels...")
-                
-                with st.spinner("Generating labels..."):
-                    labels = []
-                    progress = st.progress(0)
-                    
-                    for idx, (vis, qr) in enumerate(data_list):
-                        label = generate_label(
-                            label_text=vis,
-                            qr_text=qr,
+                # Check if parameters changed
+                if 'last_params' in st.session_state:
+                    if st.session_state['last_params'] != current_params and 'store' in st.session_state:
+                        params_changed = True
+
+                # Auto-regenerate if file is new, parameters changed, or no labels exist yet
+                if file_changed or params_changed or 'store' not in st.session_state:
+                    #if params_changed and auto_update:
+                    #    st.info("🔄 Parameters changed - auto-updating labels...")
+
+                    with st.spinner("Generating labels..."):
+                        # Keep rows and layout only; pixels are rendered per page when needed
+                        layout = dict(
                             width=label_width,
                             height=label_height,
                             margin=margin,
@@ -643,81 +1395,87 @@ with col_upload:
                             label_color=label_color_rgba,
                             border_color=border_color_rgba
                         )
-                        labels.append(label)
-                        progress.progress((idx + 1) / len(data_list))
-                    
-                    grids = group_labels(labels, grid_rows, grid_cols, grid_spacing)
-                    
-                    progress.empty()  # Clear progress bar
-                    #st.success(f"✅ {len(grids)} grids created")
-                    st.info(f"✅ {len(labels)} labels & {len(grids)} grids generated")
-                    
+                        store = build_store(files, layout, (grid_rows, grid_cols, grid_spacing))
 
+                        # Release the previous store's cached pages right away
+                        if 'store' in st.session_state:
+                            st.session_state['store'].clear()
+
+                        st.info(f"✅ {len(store)} labels & {store.num_pages} grids generated")
+
+                        st.session_state['store'] = store
+                        st.session_state['last_params'] = current_params
                     
-                    st.session_state['labels'] = labels
-                    st.session_state['grids'] = grids
-                    st.session_state['data'] = data_list
-                    st.session_state['last_params'] = current_params
-                    
-                    # Rerun to show updated preview immediately
-                    st.rerun()
+                        # Rerun to show updated preview immediately
+                        st.rerun()
 
-with col_preview:
-    st.subheader("🪄 Preview")
+    with col_preview:
+        st.subheader("🪄 Preview")
 
-    if 'labels' in st.session_state and 'grids' in st.session_state:
-        tabs = st.tabs(["Labels", "Grids", "Download"])
+        if 'store' in st.session_state:
+            store = st.session_state['store']
+            tabs = st.tabs(["Labels", "Grids", "Download"])
 
-        with tabs[0]:  # Labels tab
-            st.info(f"★ Showing first 3 of {len(st.session_state['labels'])} labels")
-            for idx in range(min(3, len(st.session_state['labels']))):
-                st.image(st.session_state['labels'][idx])
+            with tabs[0]:  # Labels tab
+                st.info(f"★ Showing first 3 of {len(store)} labels")
+                for idx in range(min(3, len(store))):
+                    st.image(store.render_label(idx))
         
-        with tabs[1]:  # Grids tab
-            if st.session_state.get('grids'):
-                st.info(f"★ Showing first grid of {len(st.session_state['grids'])} total pages")
-                st.image(st.session_state['grids'][0], caption="Grid 1 (Page 1)")
-            else:
-                st.info("No grids available")
+            with tabs[1]:  # Grids tab
+                if store.num_pages:
+                    st.info(f"★ Showing first grid of {store.num_pages} total pages")
+                    st.image(store.page(0), caption="Grid 1 (Page 1)")
+                else:
+                    st.info("No grids available")
         
-        with tabs[2]:  # Download tab
-            # Download Section
-            pdf_name = st.text_input("PDF file name", value="labels", 
-                                   help="Enter the name for your PDF file (without .pdf extension)")
+            with tabs[2]:  # Download tab
+                # Download Section
+                pdf_name = st.text_input("PDF file name", value="labels", 
+                                       help="Enter the name for your PDF file (without .pdf extension)")
             
-            # PDF Quality Settings
-            pdf1, pdf2 = st.columns(2)
-            with pdf1:
-                qual = st.slider("Image Quality", min_value=10, max_value=100, value=95, step=5,
-                                help="Higher quality results in better images but larger file sizes.")
-            with pdf2:
-                dpi = st.slider("DPI", min_value=70, max_value=600, value=150, step=10,
-                               help="Higher DPI (Dots Per Inch) results in better print quality but larger file sizes.")
+                # PDF Quality Settings
+                pdf1, pdf2 = st.columns(2)
+                with pdf1:
+                    qual = st.slider("Image Quality", min_value=10, max_value=100, value=95, step=5,
+                                    help="Higher quality results in better images but larger file sizes.")
+                with pdf2:
+                    dpi = st.slider("DPI", min_value=70, max_value=600, value=150, step=10,
+                                   help="Higher DPI (Dots Per Inch) results in better print quality but larger file sizes.")
             
-            st.markdown("---")
-
-            # Generar PDF primero (sin mostrar botón de descarga separado)
-            with st.spinner("Preparing PDF..."):
-                pdf_bytes = create_pdf(st.session_state['grids'], dpi=dpi, qual=qual)
+                # Several files: one merged PDF (each file starts on a new page) or one PDF per file
+                per_file = False
+                if len(store.sections) > 1:
+                    per_file = st.radio("Output", options=["One merged PDF", "One PDF per file (ZIP)"],
+                                        horizontal=True) != "One merged PDF"
+
+                st.markdown("---")
+
+                # Render the export only when asked; reuse it while the settings stay the same
+                pdf_bytes = store.cached_export(dpi=dpi, qual=qual, per_file=per_file)
+                if pdf_bytes is None:
+                    if st.button("🛠️ Prepare ZIP" if per_file else "🛠️ Prepare PDF", use_container_width=True):
+                        with st.spinner("Preparing PDF..."):
+                            pdf_bytes = store.export(dpi=dpi, qual=qual, per_file=per_file, pool=render_pool())
             
-            # Botón único de descarga
-            st.download_button(
-                label="📥 Download PDF",
-                data=pdf_bytes,
-                file_name=f"{pdf_name}.pdf",
-                mime="application/pdf",
-                use_container_width=True,
-                type="primary"
-            )
+                # Botón único de descarga
+                if pdf_bytes is not None:
+                    st.download_button(
+                        label="📥 Download ZIP" if per_file else "📥 Download PDF",
+                        data=pdf_bytes,
+                        file_name=f"{pdf_name}.zip" if per_file else f"{pdf_name}.pdf",
+                        mime="application/zip" if per_file else "application/pdf",
+                        use_container_width=True,
+                        type="primary"
+                    )
             
-            # Mensaje informativo
-            st.info(f"""
+                # Mensaje informativo
+                st.info(f"""
             Your PDF will be saved to your browser's default ***download*** folder (❀❛ ֊ ❛„)♡
             """)
 
-# Footer with links and Created by
-st.markdown("---")
-footer_html = """
+    # Footer with links and Created by
+    st.markdown("---")
+    footer_html = """
 <div style='text-align:center;color:#888;padding:20px;'>
     <div style='margin-bottom:20px;'>
         <a href='https://github.com/mariameraz/qrlabel' target='_blank' style='color:#888;text-decoration:none;margin:0 30px;'>
@@ -753,4 +1511,12 @@ footer_html = """
     </div>
 </div>
 """
-st.markdown(footer_html, unsafe_allow_html=True)
+    st.markdown(footer_html, unsafe_allow_html=True)
+
+
+# Importing the module (e.g. in spawned pool workers) only defines functions:
+# the web app runs under `streamlit run`, batch mode under plain `python qrlabels.py ...`
+if st.runtime.exists():
+    run_app()
+elif __name__ == '__main__':
+    sys.exit(main())